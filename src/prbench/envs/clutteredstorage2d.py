@@ -1,7 +1,7 @@
 """Cluttered environment where blocks must be stored on a shelf."""
 
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Iterator
 
 import gymnasium
 import numpy as np
@@ -22,13 +22,20 @@ from geom2drobotenvs.utils import (
     sample_se2_pose,
     state_has_collision,
 )
+from gymnasium.spaces import Box
 from numpy.typing import NDArray
 from relational_structs import Object, ObjectCentricState, ObjectCentricStateSpace, Type
 from relational_structs.spaces import ObjectCentricBoxSpace
-from relational_structs.utils import create_state_from_dict
-from tomsgeoms2d.structs import Rectangle
 
-from prbench.utils import get_geom2d_crv_robot_action_from_gui_input
+from prbench.utils import (
+    CRV_ROBOT_POSE_FEATURE_IDXS,
+    RECTANGLE_GEOMETRY_FEATURE_IDXS,
+    BoxObservationVectorizer,
+    create_crv_robot_template,
+    create_feature_vector,
+    create_rectangle_template,
+    get_geom2d_crv_robot_action_from_gui_input,
+)
 
 # NOTE: unlike some other environments, there are multiple target blocks here.
 TargetBlockType = Type("target_block", parent=RectangleType)
@@ -105,6 +112,14 @@ class ClutteredStorage2DEnvSpec(Geom2DRobotEnvSpec):
 
     # For initial state sampling.
     max_init_sampling_attempts: int = 10_000
+    init_sampling_batch_size: int = 256
+    # If True, first try to place the blocks outside the shelf all at once
+    # with Poisson-disk sampling, falling back to rejection sampling. This
+    # does not stall for many blocks, but is slower for few blocks. Note that
+    # this treats the x and y of target_block_out_of_shelf_pose_bounds as
+    # bounds on the block centers rather than on the bottom-left corners, so
+    # the blocks are shifted by half a block relative to rejection sampling.
+    use_poisson_disk_init_sampling: bool = False
 
     # For rendering.
     render_dpi: int = 300
@@ -136,8 +151,9 @@ class ClutteredStorage2DEnvSpec(Geom2DRobotEnvSpec):
 
     def get_target_block_in_shelf_center_positions(
         self, num_init_shelf_blocks: int, shelf_pose: SE2Pose
-    ) -> list[tuple[float, float]]:
-        """Get the init center positions for the target blocks in the shelf."""
+    ) -> NDArray[np.float64]:
+        """Get the init (x, y) center positions for the target blocks in the
+        shelf as an array of shape (num_init_shelf_blocks, 2)."""
         shelf_width = self.get_shelf_width(num_init_shelf_blocks)
         assert np.isclose(shelf_pose.theta, 0.0)
         total_half_pad = (self.shelf_width_pad + self.target_block_shape[0]) / 2
@@ -147,7 +163,7 @@ class ClutteredStorage2DEnvSpec(Geom2DRobotEnvSpec):
         # NOTE: there is an implicit assumption here that the shelf is not too
         # deep for the robot to reach in and grab the objects.
         y = shelf_pose.y + 2 * self.target_block_shape[1]
-        return [(x, y) for x in xs]
+        return np.column_stack((xs, np.full(xs.shape, y)))
 
 
 class ObjectCentricClutteredStorage2DEnv(Geom2DRobotEnv):
@@ -168,71 +184,253 @@ class ObjectCentricClutteredStorage2DEnv(Geom2DRobotEnv):
         self._num_init_shelf_blocks = num_blocks // 2
         self._num_init_outside_blocks = num_blocks - self._num_init_shelf_blocks
         self._spec: ClutteredStorage2DEnvSpec = spec  # for type checking
+        self._shelf_width = spec.get_shelf_width(self._num_init_shelf_blocks)
         self.metadata = {
             "render_modes": ["rgb_array"],
             "render_fps": self._spec.render_fps,
         }
+        assert isinstance(self.action_space, CRVRobotActionSpace)
+        # NOTE: these are kept as float32 so that the wall shapes are the same
+        # as when they were computed from the action space arrays.
+        self._action_bounds_xy = (
+            self.action_space.low[0],
+            self.action_space.low[1],
+            self.action_space.high[0],
+            self.action_space.high[1],
+        )
+        # The walls only depend on the spec and action space, so create them once.
+        constant_initial_state_dict = self._create_constant_initial_state_dict()
+        self._constant_initial_state_data = {
+            o: create_feature_vector(o.type, d)
+            for o, d in constant_initial_state_dict.items()
+        }
+        self._wall_objects = set(self._constant_initial_state_data)
+        self._wall_geoms = np.array(
+            [
+                v[RECTANGLE_GEOMETRY_FEATURE_IDXS]
+                for v in self._constant_initial_state_data.values()
+            ]
+        )
+        self._initial_state_templates = self._create_initial_state_templates()
+        self._target_blocks = [
+            Object(f"block{i}", TargetBlockType) for i in range(num_blocks)
+        ]
+        # Reused when sampling the rotations of the blocks in the shelf.
+        self._rot_buf = np.empty(self._num_init_shelf_blocks, dtype=np.float64)
+        # Objects that are looked up every step, cached on reset.
+        self._cached_shelf: Object | None = None
+        self._cached_blocks: tuple[Object, ...] = ()
+
+    def reset(self, *args, **kwargs) -> tuple[ObjectCentricState, dict]:
+        obs, info = super().reset(*args, **kwargs)
+        assert self._current_state is not None
+        # The objects in the state do not change within an episode.
+        self._cached_shelf = self._current_state.get_objects(ShelfType)[0]
+        self._cached_blocks = tuple(self._current_state.get_objects(TargetBlockType))
+        return obs, info
 
     def _sample_initial_state(self) -> ObjectCentricState:
-        initial_state_dict = self._create_constant_initial_state_dict()
-        static_objects = set(initial_state_dict)
+        spec = self._spec
+        rng = self.np_random
+        block_width, block_height = spec.target_block_shape
+        initial_state_data = self._constant_initial_state_data
+        static_objects = self._wall_objects
         # Sample robot pose.
-        robot_pose = sample_se2_pose(self._spec.robot_init_pose_bounds, self.np_random)
+        robot_pose = sample_se2_pose(spec.robot_init_pose_bounds, rng)
         # Sample shelf pose.
-        shelf_init_pose_bounds = self._spec.get_shelf_init_pose_bounds(
+        shelf_init_pose_bounds = spec.get_shelf_init_pose_bounds(
             self._num_init_shelf_blocks
         )
-        shelf_pose = sample_se2_pose(shelf_init_pose_bounds, self.np_random)
+        shelf_pose = sample_se2_pose(shelf_init_pose_bounds, rng)
         # Sample the target block rotations for those in the shelf.
-        shelf_target_block_rotations = self.np_random.uniform(
-            *self._spec.target_block_in_shelf_rotation_bounds,
-            size=self._num_init_shelf_blocks,
-        ).tolist()
-        state = self._create_initial_state(
-            initial_state_dict, robot_pose, shelf_pose, shelf_target_block_rotations
+        # NOTE: this matches rng.uniform(low, high, size) but reuses a buffer.
+        rot_low, rot_high = spec.target_block_in_shelf_rotation_bounds
+        shelf_target_block_rotations = rng.random(out=self._rot_buf)
+        shelf_target_block_rotations *= rot_high - rot_low
+        shelf_target_block_rotations += rot_low
+        state, _ = self._create_initial_state(
+            initial_state_data, robot_pose, shelf_pose, shelf_target_block_rotations
         )
         robot = state.get_objects(CRVRobotType)[0]
-        assert not state_has_collision(state, {robot}, static_objects, {})
+        # The robot is the only object that outside blocks are checked against
+        # with state_has_collision(), so create the set once.
+        robot_set = {robot}
+        assert not state_has_collision(state, robot_set, static_objects, {})
+        # Geometries of all rectangles that target blocks may collide with, which
+        # is everything except the shelf (on the floor). These are used to check
+        # candidate block poses without creating states. The wall geometries
+        # never change, so only get the others.
+        episode_rects = [
+            r
+            for r in state.get_objects(RectangleType)
+            if r not in static_objects and not r.is_instance(ShelfType)
+        ]
+        episode_geoms = np.array(
+            [state[r][RECTANGLE_GEOMETRY_FEATURE_IDXS] for r in episode_rects]
+        )
+        obstacle_geoms = np.vstack([self._wall_geoms, episode_geoms])
+        obstacle_aabbs = get_rectangle_aabbs(*obstacle_geoms.T)
+        if spec.use_poisson_disk_init_sampling:
+            poisson_disk_state = self._sample_target_blocks_outside_poisson_disk(
+                initial_state_data,
+                robot_pose,
+                shelf_pose,
+                shelf_target_block_rotations,
+                obstacle_aabbs,
+                robot_set,
+            )
+            if poisson_disk_state is not None:
+                return poisson_disk_state
         # Sample target block poses for those outside the shelf.
         target_block_outside_poses: list[SE2Pose] = []
         for _ in range(self._num_init_outside_blocks):
-            for _ in range(self._spec.max_init_sampling_attempts):
-                pose = sample_se2_pose(
-                    self._spec.target_block_out_of_shelf_pose_bounds, self.np_random
-                )
-                # Make sure in bounds.
-                if not (
-                    self._spec.world_min_x < pose.x < self._spec.world_max_x
-                    and self._spec.world_min_y < pose.y < self._spec.world_max_y
-                ):
-                    continue
-                # Check for collisions.
-                state = self._create_initial_state(
-                    initial_state_dict,
+            for pose in self._sample_target_block_outside_pose_candidates(
+                obstacle_geoms, obstacle_aabbs
+            ):
+                # Check for collisions with the robot.
+                state, blocks = self._create_initial_state(
+                    initial_state_data,
                     robot_pose,
                     shelf_pose,
                     shelf_target_block_rotations,
                     target_block_outside_poses=target_block_outside_poses + [pose],
                 )
-                obj_name_to_obj = {o.name: o for o in state}
-                num_blocks = sum(b.startswith("block") for b in obj_name_to_obj)
-                new_block = obj_name_to_obj[f"block{num_blocks-1}"]
-                if not state_has_collision(state, {new_block}, set(state), {}):
+                new_block = blocks[-1]
+                if not state_has_collision(state, {new_block}, robot_set, {}):
                     break
             else:
                 raise RuntimeError("Failed to sample obstruction pose.")
             # Update target blocks.
             target_block_outside_poses.append(pose)
+            new_block_geom = np.array(
+                [pose.x, pose.y, block_width, block_height, pose.theta]
+            )
+            obstacle_geoms = np.vstack([obstacle_geoms, new_block_geom])
+            new_block_aabb = get_rectangle_aabbs(*new_block_geom[:, None])
+            obstacle_aabbs = np.vstack([obstacle_aabbs, new_block_aabb])
         # The state should already be finalized.
         return state
 
+    def _sample_target_blocks_outside_poisson_disk(
+        self,
+        initial_state_data: dict[Object, NDArray[np.float64]],
+        robot_pose: SE2Pose,
+        shelf_pose: SE2Pose,
+        shelf_target_block_rotations: NDArray[np.float64],
+        obstacle_aabbs: NDArray[np.float64],
+        robot_set: set[Object],
+    ) -> ObjectCentricState | None:
+        """Place all target blocks outside the shelf at once by sampling their
+        centers with Poisson-disk sampling, or return None on failure.
+
+        The centers are at least a block diagonal apart and a half
+        diagonal away from the obstacle bounding boxes and a box around
+        the retracted robot, so the blocks cannot collide with each
+        other or the obstacles for any rotation. The robot collision
+        check is kept as a safeguard. The x and y pose bounds are used
+        as bounds on the block centers.
+        """
+        spec = self._spec
+        lb, ub = spec.target_block_out_of_shelf_pose_bounds
+        block_width, block_height = spec.target_block_shape
+        block_diagonal = np.hypot(block_width, block_height)
+        pad = block_diagonal / 2
+        robot_reach = (
+            spec.robot_base_radius
+            + spec.robot_gripper_width
+            + spec.robot_gripper_height
+        )
+        robot_aabb = (
+            robot_pose.x - robot_reach,
+            robot_pose.y - robot_reach,
+            robot_pose.x + robot_reach,
+            robot_pose.y + robot_reach,
+        )
+        forbidden_aabbs = np.vstack([obstacle_aabbs, robot_aabb])
+        centers = poisson_disk_2d(
+            self.np_random,
+            (lb.x, lb.y, ub.x, ub.y),
+            block_diagonal,
+            forbidden_aabbs + (-pad, -pad, pad, pad),
+            self._num_init_outside_blocks,
+        )
+        if len(centers) < self._num_init_outside_blocks:
+            return None
+        thetas = self.np_random.uniform(lb.theta, ub.theta, size=len(centers))
+        block_geoms = get_rectangles_from_centers(
+            centers[:, 0], centers[:, 1], block_width, block_height, thetas
+        )
+        target_block_outside_poses = [
+            SE2Pose(x, y, theta) for x, y, _, _, theta in block_geoms
+        ]
+        state, blocks = self._create_initial_state(
+            initial_state_data,
+            robot_pose,
+            shelf_pose,
+            shelf_target_block_rotations,
+            target_block_outside_poses=target_block_outside_poses,
+        )
+        outside_blocks = set(blocks[self._num_init_shelf_blocks :])
+        if state_has_collision(state, outside_blocks, robot_set, {}):
+            return None
+        return state
+
+    def _sample_target_block_outside_pose_candidates(
+        self, obstacle_geoms: NDArray[np.float64], obstacle_aabbs: NDArray[np.float64]
+    ) -> Iterator[SE2Pose]:
+        """Sample candidate poses for a target block outside the shelf that are
+        in bounds and do not overlap the given obstacle rectangles.
+
+        Candidates are sampled in batches. Only those whose bounding
+        boxes overlap an obstacle bounding box need the exact overlap
+        check. The RNG is left as if the candidates up to the yielded
+        one were sampled one at a time, so the sampled initial states do
+        not depend on the batch size.
+        """
+        spec = self._spec
+        rng = self.np_random
+        lb, ub = spec.target_block_out_of_shelf_pose_bounds
+        block_width, block_height = spec.target_block_shape
+        num_attempts = spec.max_init_sampling_attempts
+        for start in range(0, num_attempts, spec.init_sampling_batch_size):
+            batch_size = min(spec.init_sampling_batch_size, num_attempts - start)
+            batch_start_rng_state = rng.bit_generator.state
+            candidates = rng.uniform(
+                (lb.x, lb.y, lb.theta), (ub.x, ub.y, ub.theta), size=(batch_size, 3)
+            )
+            batch_end_rng_state = rng.bit_generator.state
+            xs, ys, thetas = candidates.T
+            aabbs = get_rectangle_aabbs(xs, ys, block_width, block_height, thetas)
+            # Touching bounding boxes overlap, like touching rectangles.
+            aabb_overlaps = (
+                (aabbs[:, None, 0] <= obstacle_aabbs[None, :, 2])
+                & (aabbs[:, None, 2] >= obstacle_aabbs[None, :, 0])
+                & (aabbs[:, None, 1] <= obstacle_aabbs[None, :, 3])
+                & (aabbs[:, None, 3] >= obstacle_aabbs[None, :, 1])
+            )
+            in_bounds = (
+                (spec.world_min_x < xs)
+                & (xs < spec.world_max_x)
+                & (spec.world_min_y < ys)
+                & (ys < spec.world_max_y)
+            )
+            for i in np.flatnonzero(in_bounds):
+                x, y, theta = candidates[i]
+                overlapping = aabb_overlaps[i]
+                if overlapping.any():
+                    geom = np.array([x, y, block_width, block_height, theta])
+                    if np.any(rectangles_overlap(geom, obstacle_geoms[overlapping])):
+                        continue
+                rng.bit_generator.state = batch_start_rng_state
+                rng.random(3 * (i + 1))
+                yield SE2Pose(x, y, theta)
+            rng.bit_generator.state = batch_end_rng_state
+
     def _create_constant_initial_state_dict(self) -> dict[Object, dict[str, float]]:
         init_state_dict: dict[Object, dict[str, float]] = {}
 
         # Create room walls.
-        assert isinstance(self.action_space, CRVRobotActionSpace)
-        min_dx, min_dy = self.action_space.low[:2]
-        max_dx, max_dy = self.action_space.high[:2]
+        min_dx, min_dy, max_dx, max_dy = self._action_bounds_xy
         wall_state_dict = create_walls_from_world_boundaries(
             self._spec.world_min_x,
             self._spec.world_max_x,
@@ -247,143 +445,161 @@ class ObjectCentricClutteredStorage2DEnv(Geom2DRobotEnv):
 
         return init_state_dict
 
+    def _create_initial_state_templates(self) -> dict[str, NDArray[np.float64]]:
+        """Create feature vectors for the objects that are created in every
+        initial state, leaving the poses and shapes that vary between initial
+        states as zeros."""
+        return {
+            "robot": create_crv_robot_template(
+                self._spec.robot_base_radius,
+                self._spec.robot_arm_length,
+                self._spec.robot_gripper_height,
+                self._spec.robot_gripper_width,
+            ),
+            "shelf": create_rectangle_template(
+                ShelfType, self._spec.shelf_rgb, ZOrder.FLOOR, static=True
+            ),
+            "shelf_bookend": create_rectangle_template(
+                RectangleType, BLACK, ZOrder.ALL, static=True
+            ),
+            "target_block": create_rectangle_template(
+                TargetBlockType,
+                self._spec.target_block_rgb,
+                ZOrder.SURFACE,
+                static=False,
+            ),
+        }
+
     def _create_initial_state(
         self,
-        constant_initial_state_dict: dict[Object, dict[str, float]],
+        constant_initial_state_data: dict[Object, NDArray[np.float64]],
         robot_pose: SE2Pose,
         shelf_pose: SE2Pose,
-        shelf_target_block_rotations: list[float],
+        shelf_target_block_rotations: NDArray[np.float64],
         target_block_outside_poses: list[SE2Pose] | None = None,
-    ) -> ObjectCentricState:
-
-        # Shallow copy should be okay because the constant objects should not
-        # ever change in this method.
-        init_state_dict = constant_initial_state_dict.copy()
+    ) -> tuple[ObjectCentricState, list[Object]]:
+        """Create the initial state and also return the target blocks in the
+        order that they were added.
+
+        Feature vectors are filled in from the templates created in
+        __init__ rather than from dicts of named features.
+        """
+        spec = self._spec
+        templates = self._initial_state_templates
+        world_min_x, world_max_x = spec.world_min_x, spec.world_max_x
+        shelf_x, shelf_y, shelf_theta = shelf_pose.x, shelf_pose.y, shelf_pose.theta
+        shelf_width = self._shelf_width
+        shelf_height = spec.shelf_height
+        block_width, block_height = spec.target_block_shape
+        init_state_data: dict[Object, NDArray[Any]] = {
+            o: v.copy() for o, v in constant_initial_state_data.items()
+        }
 
         # Create the robot.
         robot = Object("robot", CRVRobotType)
-        init_state_dict[robot] = {
-            "x": robot_pose.x,
-            "y": robot_pose.y,
-            "theta": robot_pose.theta,
-            "base_radius": self._spec.robot_base_radius,
-            "arm_joint": self._spec.robot_base_radius,  # arm is fully retracted
-            "arm_length": self._spec.robot_arm_length,
-            "vacuum": 0.0,  # vacuum is off
-            "gripper_height": self._spec.robot_gripper_height,
-            "gripper_width": self._spec.robot_gripper_width,
-        }
+        robot_vec = templates["robot"].copy()
+        robot_vec[CRV_ROBOT_POSE_FEATURE_IDXS] = (
+            robot_pose.x,
+            robot_pose.y,
+            robot_pose.theta,
+        )
+        init_state_data[robot] = robot_vec
 
         # Create the shelf.
         shelf = Object("shelf", ShelfType)
-        shelf_width = self._spec.get_shelf_width(self._num_init_shelf_blocks)
-        init_state_dict[shelf] = {
-            "x": shelf_pose.x,
-            "y": shelf_pose.y,
-            "theta": shelf_pose.theta,
-            "width": shelf_width,
-            "height": self._spec.shelf_height,
-            "static": True,
-            "color_r": self._spec.shelf_rgb[0],
-            "color_g": self._spec.shelf_rgb[1],
-            "color_b": self._spec.shelf_rgb[2],
-            "z_order": ZOrder.FLOOR.value,
-        }
+        shelf_vec = templates["shelf"].copy()
+        shelf_vec[RECTANGLE_GEOMETRY_FEATURE_IDXS] = (
+            shelf_x,
+            shelf_y,
+            shelf_width,
+            shelf_height,
+            shelf_theta,
+        )
+        init_state_data[shelf] = shelf_vec
 
         # Create the left shelf bookend.
         shelf_left_bookend = Object("shelf_left_bookend", RectangleType)
-        init_state_dict[shelf_left_bookend] = {
-            "x": self._spec.world_min_x,
-            "y": shelf_pose.y,
-            "theta": shelf_pose.theta,
-            "width": shelf_pose.x - self._spec.world_min_x,
-            "height": self._spec.shelf_height,
-            "static": True,
-            "color_r": BLACK[0],
-            "color_g": BLACK[1],
-            "color_b": BLACK[2],
-            "z_order": ZOrder.ALL.value,
-        }
+        left_bookend_vec = templates["shelf_bookend"].copy()
+        left_bookend_vec[RECTANGLE_GEOMETRY_FEATURE_IDXS] = (
+            world_min_x,
+            shelf_y,
+            shelf_x - world_min_x,
+            shelf_height,
+            shelf_theta,
+        )
+        init_state_data[shelf_left_bookend] = left_bookend_vec
 
         # Create the right shelf bookend.
         shelf_right_bookend = Object("shelf_right_bookend", RectangleType)
-        init_state_dict[shelf_right_bookend] = {
-            "x": shelf_pose.x + shelf_width,
-            "y": shelf_pose.y,
-            "theta": shelf_pose.theta,
-            "width": self._spec.world_max_x - (shelf_pose.x + shelf_width),
-            "height": self._spec.shelf_height,
-            "static": True,
-            "color_r": BLACK[0],
-            "color_g": BLACK[1],
-            "color_b": BLACK[2],
-            "z_order": ZOrder.ALL.value,
-        }
-
-        # Create the target blocks that are initially in the shelf. Evenly space
-        # them horizontally and apply rotations.
-        block_num = 0
-        target_block_in_shelf_center_positions = (
-            self._spec.get_target_block_in_shelf_center_positions(
-                self._num_init_shelf_blocks, shelf_pose
-            )
+        right_bookend_vec = templates["shelf_bookend"].copy()
+        right_bookend_vec[RECTANGLE_GEOMETRY_FEATURE_IDXS] = (
+            shelf_x + shelf_width,
+            shelf_y,
+            world_max_x - (shelf_x + shelf_width),
+            shelf_height,
+            shelf_theta,
         )
-        for (center_x, center_y), rot in zip(
-            target_block_in_shelf_center_positions,
+        init_state_data[shelf_right_bookend] = right_bookend_vec
+
+        # Create the target blocks. Those initially in the shelf come first and
+        # are evenly spaced horizontally with rotations applied.
+        if target_block_outside_poses is None:
+            target_block_outside_poses = []
+        num_in_shelf = self._num_init_shelf_blocks
+        num_blocks = num_in_shelf + len(target_block_outside_poses)
+        center_xs, center_ys = spec.get_target_block_in_shelf_center_positions(
+            num_in_shelf, shelf_pose
+        ).T
+        assert len(shelf_target_block_rotations) == num_in_shelf
+        block_geoms = np.empty((num_blocks, len(RECTANGLE_GEOMETRY_FEATURE_IDXS)))
+        block_geoms[:num_in_shelf] = get_rectangles_from_centers(
+            center_xs,
+            center_ys,
+            block_width,
+            block_height,
             shelf_target_block_rotations,
-            strict=True,
-        ):
-            block = Object(f"block{block_num}", TargetBlockType)
-            block_num += 1
-            rect = Rectangle.from_center(
-                center_x,
-                center_y,
-                self._spec.target_block_shape[0],
-                self._spec.target_block_shape[1],
-                rot,
-            )
-            init_state_dict[block] = {
-                "x": rect.x,
-                "y": rect.y,
-                "theta": rect.theta,
-                "width": rect.width,
-                "height": rect.height,
-                "static": False,
-                "color_r": self._spec.target_block_rgb[0],
-                "color_g": self._spec.target_block_rgb[1],
-                "color_b": self._spec.target_block_rgb[2],
-                "z_order": ZOrder.SURFACE.value,
-            }
-
+        )
         # Create the target blocks that are initially outside the shelf.
-        if target_block_outside_poses is not None:
-            for pose in target_block_outside_poses:
-                block = Object(f"block{block_num}", TargetBlockType)
-                block_num += 1
-                init_state_dict[block] = {
-                    "x": pose.x,
-                    "y": pose.y,
-                    "theta": pose.theta,
-                    "width": self._spec.target_block_shape[0],
-                    "height": self._spec.target_block_shape[1],
-                    "static": False,
-                    "color_r": self._spec.target_block_rgb[0],
-                    "color_g": self._spec.target_block_rgb[1],
-                    "color_b": self._spec.target_block_rgb[2],
-                    "z_order": ZOrder.SURFACE.value,
-                }
+        for i, pose in enumerate(target_block_outside_poses, start=num_in_shelf):
+            block_geoms[i] = (pose.x, pose.y, block_width, block_height, pose.theta)
+        block_vecs = np.tile(templates["target_block"], (num_blocks, 1))
+        block_vecs[:, RECTANGLE_GEOMETRY_FEATURE_IDXS] = block_geoms
+        blocks = self._target_blocks[:num_blocks]
+        init_state_data.update(zip(blocks, block_vecs))
 
         # Finalize state.
-        return create_state_from_dict(init_state_dict, Geom2DRobotEnvTypeFeatures)
+        state = ObjectCentricState(init_state_data, Geom2DRobotEnvTypeFeatures)
+        return state, blocks
 
     def _get_reward_and_done(self) -> tuple[float, bool]:
         assert self._current_state is not None
-        shelf = self._current_state.get_objects(ShelfType)[0]
-        blocks = self._current_state.get_objects(TargetBlockType)
-        terminated = all(
-            is_inside(self._current_state, block, shelf, self._static_object_body_cache)
-            for block in blocks
-        )
+        assert self._cached_shelf is not None, "Need to call reset()"
+        shelf_geom = self._current_state[self._cached_shelf][
+            RECTANGLE_GEOMETRY_FEATURE_IDXS
+        ]
+        shelf_x, shelf_y, shelf_width, shelf_height, shelf_theta = shelf_geom
+        if np.isclose(shelf_theta, 0.0):
+            # Fast path: the shelf is axis-aligned, so check all blocks at once.
+            block_geoms = np.array(
+                [
+                    self._current_state[block][RECTANGLE_GEOMETRY_FEATURE_IDXS]
+                    for block in self._cached_blocks
+                ]
+            )
+            shelf_aabb = np.array(
+                [shelf_x, shelf_y, shelf_x + shelf_width, shelf_y + shelf_height]
+            )
+            terminated = all_rects_inside_aabb(block_geoms, shelf_aabb)
+        else:
+            terminated = all(
+                is_inside(
+                    self._current_state,
+                    block,
+                    self._cached_shelf,
+                    self._static_object_body_cache,
+                )
+                for block in self._cached_blocks
+            )
         return -1.0, terminated
 
 
@@ -394,6 +610,7 @@ class ClutteredStorage2DEnv(gymnasium.Env[NDArray[np.float32], NDArray[np.float3
         self,
         num_blocks: int = 3,
         spec: ClutteredStorage2DEnvSpec = ClutteredStorage2DEnvSpec(),
+        feature_major_obs: bool = False,
         **kwargs,
     ) -> None:
         super().__init__()
@@ -408,26 +625,50 @@ class ClutteredStorage2DEnv(gymnasium.Env[NDArray[np.float32], NDArray[np.float3
         assert isinstance(self._geom2d_env.observation_space, ObjectCentricStateSpace)
         # Make observation vectors start with the robot, then the shelf,
         # then target blocks. Don't include the walls or because those are
-        # universally constant.
-        exemplar_object_centric_state, _ = self._geom2d_env.reset()
-        obj_name_to_obj = {o.name: o for o in exemplar_object_centric_state}
+        # universally constant. The objects follow the naming convention in
+        # _create_initial_state(), so there is no need to sample a state here.
+        # NOTE: block names are sorted as strings, e.g., block10 before block2.
         self._constant_objects = [
-            obj_name_to_obj["robot"],
-            obj_name_to_obj["shelf"],
+            Object("robot", CRVRobotType),
+            Object("shelf", ShelfType),
         ]
-        block_names = {o for o in obj_name_to_obj if o.startswith("block")}
-        assert len(block_names) == num_blocks
-        for block_name in sorted(block_names):
-            self._constant_objects.append(obj_name_to_obj[block_name])
+        block_names = sorted(f"block{i}" for i in range(num_blocks))
+        for block_name in block_names:
+            self._constant_objects.append(Object(block_name, TargetBlockType))
         self.observation_space = self._geom2d_env.observation_space.to_box(
             self._constant_objects, Geom2DRobotEnvTypeFeatures
         )
         self.action_space = self._geom2d_env.action_space
         assert isinstance(self.observation_space, ObjectCentricBoxSpace)
         assert isinstance(self.action_space, CRVRobotActionSpace)
+        self._vectorizer = BoxObservationVectorizer(self.observation_space)
+        # Optionally group the observation by feature (all x, then all y, ...)
+        # rather than by object, which is friendlier to batched featurizers.
+        self._feature_major_perm: NDArray[np.int64] | None = None
+        if feature_major_obs:
+            obs_features = [
+                (obj.name, feat)
+                for obj in self._constant_objects
+                for feat in Geom2DRobotEnvTypeFeatures[obj.type]
+            ]
+            feature_order = list(dict.fromkeys(feat for _, feat in obs_features))
+            feature_group_ids = [feature_order.index(feat) for _, feat in obs_features]
+            perm = np.argsort(feature_group_ids, kind="stable")
+            self._feature_major_perm = perm
+            # The ObjectCentricBoxSpace methods, like devectorize(), assume the
+            # per-object layout, so use a plain Box for feature-major observations.
+            self.observation_space = Box(
+                self.observation_space.low[perm],
+                self.observation_space.high[perm],
+                dtype=np.float32,
+            )
+            obs_md = create_feature_major_markdown_description(
+                [obs_features[i] for i in perm]
+            )
+        else:
+            obs_md = self.observation_space.create_markdown_description()
         # Add descriptions to metadata for doc generation.
         env_md = create_env_description(num_blocks)
-        obs_md = self.observation_space.create_markdown_description()
         act_md = self.action_space.create_markdown_description()
         reward_md = "A penalty of -1.0 is given at every time step until termination, which occurs when all blocks are inside the shelf.\n"  # pylint: disable=line-too-long
         references_md = "Similar environments have been considered by many others, especially in the task and motion planning literature.\n"  # pylint: disable=line-too-long
@@ -444,8 +685,7 @@ class ClutteredStorage2DEnv(gymnasium.Env[NDArray[np.float32], NDArray[np.float3
     def reset(self, *args, **kwargs) -> tuple[NDArray[np.float32], dict]:
         super().reset(*args, **kwargs)  # necessary to reset RNG if seed is given
         obs, info = self._geom2d_env.reset(*args, **kwargs)
-        assert isinstance(self.observation_space, ObjectCentricBoxSpace)
-        vec_obs = self.observation_space.vectorize(obs)
+        vec_obs = self._vectorize(obs)
         return vec_obs, info
 
     def step(
@@ -454,10 +694,16 @@ class ClutteredStorage2DEnv(gymnasium.Env[NDArray[np.float32], NDArray[np.float3
         obs, reward, terminated, truncated, done = self._geom2d_env.step(
             *args, **kwargs
         )
-        assert isinstance(self.observation_space, ObjectCentricBoxSpace)
-        vec_obs = self.observation_space.vectorize(obs)
+        vec_obs = self._vectorize(obs)
         return vec_obs, reward, terminated, truncated, done
 
+    def _vectorize(self, obs: ObjectCentricState) -> NDArray[np.float32]:
+        vec_obs = self._vectorizer.vectorize(obs)
+        if self._feature_major_perm is not None:
+            # Fancy indexing already returns a copy.
+            return vec_obs[self._feature_major_perm]
+        return vec_obs.copy()
+
     def render(self):
         return self._geom2d_env.render()
 
@@ -478,3 +724,211 @@ There are always {num_blocks} blocks in this environment.
 
 The robot has a movable circular base and a retractable arm with a rectangular vacuum end effector. Objects can be grasped and ungrasped when the end effector makes contact.
 """
+
+
+def create_feature_major_markdown_description(
+    obs_features: list[tuple[str, str]],
+) -> str:
+    """Create a markdown description of a feature-major observation, given the
+    (object name, feature name) at each index."""
+    md_table_str = "| **Index** | **Object** | **Feature** |"
+    md_table_str += "\n| --- | --- | --- |"
+    for idx, (obj_name, feat) in enumerate(obs_features):
+        md_table_str += f"\n| {idx} | {obj_name} | {feat} |"
+    return f"The entries of an array in this Box space correspond to the following object features:\n{md_table_str}\n"  # pylint: disable=line-too-long
+
+
+def get_rectangle_vertices(
+    xs: NDArray[np.float64],
+    ys: NDArray[np.float64],
+    widths: NDArray[np.float64] | float,
+    heights: NDArray[np.float64] | float,
+    thetas: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    """Get the vertices of rectangles as an array of shape (N, 4, 2).
+
+    Following tomsgeoms2d, (x, y) is the bottom-left vertex and theta
+    rotates about that vertex. The vertices are in the same order as
+    Rectangle.vertices.
+    """
+    cos_thetas = np.cos(thetas)
+    sin_thetas = np.sin(thetas)
+    vertex_xs = np.stack(
+        [
+            xs,
+            xs - heights * sin_thetas,
+            xs + widths * cos_thetas - heights * sin_thetas,
+            xs + widths * cos_thetas,
+        ],
+        axis=-1,
+    )
+    vertex_ys = np.stack(
+        [
+            ys,
+            ys + heights * cos_thetas,
+            ys + widths * sin_thetas + heights * cos_thetas,
+            ys + widths * sin_thetas,
+        ],
+        axis=-1,
+    )
+    return np.stack([vertex_xs, vertex_ys], axis=-1)
+
+
+def get_rectangle_aabbs(
+    xs: NDArray[np.float64],
+    ys: NDArray[np.float64],
+    widths: NDArray[np.float64] | float,
+    heights: NDArray[np.float64] | float,
+    thetas: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    """Get the axis-aligned bounding boxes of rectangles as an array of rows
+    (min_x, min_y, max_x, max_y)."""
+    vertices = get_rectangle_vertices(xs, ys, widths, heights, thetas)
+    return np.concatenate([vertices.min(axis=-2), vertices.max(axis=-2)], axis=-1)
+
+
+def rectangles_overlap(
+    rect: NDArray[np.float64], others: NDArray[np.float64]
+) -> NDArray[np.bool_]:
+    """Check which of the other rectangles overlap the given one.
+
+    Rectangles are given as rows (x, y, width, height, theta). Uses the
+    separating axis theorem, where the candidate axes are the edge
+    normals of both rectangles. Touching rectangles overlap.
+    """
+    vertices = get_rectangle_vertices(*rect)
+    other_vertices = get_rectangle_vertices(*others.T)
+    thetas = np.stack(np.broadcast_arrays(rect[4], others[:, 4]), axis=-1)
+    # Axes have shape (K, 4, 2): two edge normals for each rectangle.
+    axes = np.concatenate(
+        [
+            np.stack([np.cos(thetas), np.sin(thetas)], axis=-1),
+            np.stack([-np.sin(thetas), np.cos(thetas)], axis=-1),
+        ],
+        axis=1,
+    )
+    # Projections have shape (K, 4 axes, 4 vertices).
+    projs = np.einsum("kad,vd->kav", axes, vertices)
+    other_projs = np.einsum("kad,kvd->kav", axes, other_vertices)
+    separated = (projs.max(axis=-1) < other_projs.min(axis=-1)) | (
+        other_projs.max(axis=-1) < projs.min(axis=-1)
+    )
+    return ~separated.any(axis=-1)
+
+
+def get_rectangles_from_centers(
+    center_xs: NDArray[np.float64],
+    center_ys: NDArray[np.float64],
+    width: float,
+    height: float,
+    thetas: NDArray[np.float64],
+) -> NDArray[np.float64]:
+    """Vectorized version of Rectangle.from_center() for rectangles that share
+    a shape, returning rows (x, y, width, height, theta)."""
+    cos_thetas = np.cos(thetas)
+    sin_thetas = np.sin(thetas)
+    # Rotate the offset from the center to the bottom-left vertex.
+    xs = center_xs - cos_thetas * width / 2 + sin_thetas * height / 2
+    ys = center_ys - sin_thetas * width / 2 - cos_thetas * height / 2
+    return np.stack(
+        [xs, ys, np.full_like(xs, width), np.full_like(xs, height), thetas], axis=1
+    )
+
+
+def poisson_disk_2d(
+    rng: np.random.Generator,
+    bounds: tuple[float, float, float, float],
+    min_dist: float,
+    forbidden_aabbs: NDArray[np.float64],
+    n: int,
+    num_candidates: int = 30,
+) -> NDArray[np.float64]:
+    """Sample up to n points in the box (min_x, min_y, max_x, max_y) that are
+    at least min_dist apart and outside the forbidden axis-aligned boxes.
+
+    Uses Bridson's algorithm to fill the free space with as many points
+    as fit, then chooses n of them uniformly at random. Returns an array
+    of shape (m, 2) with m < n if fewer than n points fit.
+    """
+    min_x, min_y, max_x, max_y = bounds
+    cell_size = min_dist / np.sqrt(2)
+    grid_shape = (
+        max(1, int(np.ceil((max_x - min_x) / cell_size))),
+        max(1, int(np.ceil((max_y - min_y) / cell_size))),
+    )
+    # Each grid cell contains at most one point, identified by its index. The
+    # grid is padded so that the 5x5 neighborhood of every cell is in range.
+    grid = np.full((grid_shape[0] + 4, grid_shape[1] + 4), -1, dtype=np.int64)
+    neighborhood_offsets = np.stack(
+        np.meshgrid(np.arange(5), np.arange(5), indexing="ij"), axis=-1
+    ).reshape(-1, 2)
+    # NOTE: empty grid cells gather the last row, which is masked out later, so
+    # the rows are initialized to avoid computing with uninitialized memory.
+    points = np.zeros((grid_shape[0] * grid_shape[1], 2))
+    num_points = 0
+    active: list[int] = []
+
+    def _get_cells(candidates: NDArray[np.float64]) -> NDArray[np.int64]:
+        cells = ((candidates - (min_x, min_y)) / cell_size).astype(np.int64)
+        return np.minimum(cells, np.subtract(grid_shape, 1))
+
+    def _get_valid(candidates: NDArray[np.float64]) -> NDArray[np.bool_]:
+        in_bounds = np.all(candidates >= (min_x, min_y), axis=1) & np.all(
+            candidates <= (max_x, max_y), axis=1
+        )
+        in_forbidden = (
+            (candidates[:, None, 0] >= forbidden_aabbs[None, :, 0])
+            & (candidates[:, None, 0] <= forbidden_aabbs[None, :, 2])
+            & (candidates[:, None, 1] >= forbidden_aabbs[None, :, 1])
+            & (candidates[:, None, 1] <= forbidden_aabbs[None, :, 3])
+        ).any(axis=1)
+        valid = in_bounds & ~in_forbidden
+        # Check the distances to the points in the neighboring grid cells.
+        cells = _get_cells(np.clip(candidates, (min_x, min_y), (max_x, max_y)))
+        neighborhoods = cells[:, None, :] + neighborhood_offsets[None, :, :]
+        neighbors = grid[neighborhoods[..., 0], neighborhoods[..., 1]]
+        dists_sq = np.sum((points[neighbors] - candidates[:, None, :]) ** 2, axis=2)
+        too_close = (neighbors >= 0) & (dists_sq < min_dist**2)
+        return valid & ~too_close.any(axis=1)
+
+    while True:
+        if active:
+            # Try to spawn a new point around a random active point.
+            k = int(rng.integers(len(active)))
+            radii = rng.uniform(min_dist, 2 * min_dist, size=num_candidates)
+            angles = rng.uniform(-np.pi, np.pi, size=num_candidates)
+            offsets = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+            candidates = points[active[k]] + radii[:, None] * offsets
+        else:
+            # Seed a new region of the free space, e.g., the first one.
+            candidates = rng.uniform(
+                (min_x, min_y), (max_x, max_y), size=(num_candidates, 2)
+            )
+        valid = _get_valid(candidates)
+        if not valid.any():
+            if not active:
+                break
+            active[k] = active[-1]
+            active.pop()
+            continue
+        new_point = candidates[np.argmax(valid)]
+        points[num_points] = new_point
+        i, j = _get_cells(new_point[None])[0]
+        grid[i + 2, j + 2] = num_points
+        active.append(num_points)
+        num_points += 1
+    points = points[:num_points]
+    if num_points > n:
+        points = points[rng.choice(num_points, size=n, replace=False)]
+    return points
+
+
+def all_rects_inside_aabb(
+    rects: NDArray[np.float64], aabb: NDArray[np.float64]
+) -> bool:
+    """Check whether all rectangles, given as rows (x, y, width, height,
+    theta), are inside the axis-aligned box (min_x, min_y, max_x, max_y)."""
+    rect_aabbs = get_rectangle_aabbs(*rects.T)
+    return bool(
+        np.all(rect_aabbs[:, :2] >= aabb[:2]) and np.all(rect_aabbs[:, 2:] <= aabb[2:])
+    )
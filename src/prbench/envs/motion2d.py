@@ -1,7 +1,7 @@
 """Environment where only 2D motion planning is needed to reach a goal
 region."""
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any
 
 import gymnasium
@@ -20,15 +20,23 @@ from geom2drobotenvs.utils import (
     SE2Pose,
     create_walls_from_world_boundaries,
     rectangle_object_to_geom,
-    sample_se2_pose,
     state_has_collision,
 )
 from numpy.typing import NDArray
 from relational_structs import Object, ObjectCentricState, ObjectCentricStateSpace, Type
 from relational_structs.spaces import ObjectCentricBoxSpace
-from relational_structs.utils import create_state_from_dict
-
-from prbench.utils import get_geom2d_crv_robot_action_from_gui_input
+from tomsgeoms2d.structs import Rectangle
+
+from prbench.utils import (
+    CRV_ROBOT_POSE_FEATURE_IDXS,
+    RECTANGLE_GEOMETRY_FEATURE_IDXS,
+    BoxObservationVectorizer,
+    LazyMetadata,
+    create_crv_robot_template,
+    create_feature_vector,
+    create_rectangle_template,
+    get_geom2d_crv_robot_action_from_gui_input,
+)
 
 TargetRegionType = Type("target_region", parent=RectangleType)
 Geom2DRobotEnvTypeFeatures[TargetRegionType] = list(
@@ -115,10 +123,54 @@ class Motion2DEnvSpec(Geom2DRobotEnvSpec):
         world_max_y - 2 * robot_base_radius,
     )
 
+    # For initial state sampling.
+    max_init_sampling_attempts: int = 10_000
+    # If True, check sampled initial states for collisions exactly. This is a
+    # sanity check that can be turned off for faster resets, e.g., in RL.
+    validate_initial_state: bool = True
+
     # For rendering.
     render_dpi: int = 300
     render_fps: int = 20
 
+    # The (x, y, theta) bounds above as arrays, derived in __post_init__().
+    robot_init_pose_low: NDArray[np.float64] = field(
+        init=False, repr=False, compare=False
+    )
+    robot_init_pose_high: NDArray[np.float64] = field(
+        init=False, repr=False, compare=False
+    )
+    target_region_init_low: NDArray[np.float64] = field(
+        init=False, repr=False, compare=False
+    )
+    target_region_init_high: NDArray[np.float64] = field(
+        init=False, repr=False, compare=False
+    )
+    # The robot and target region bounds concatenated, for sampling both poses
+    # with one random draw.
+    init_poses_low: NDArray[np.float64] = field(init=False, repr=False, compare=False)
+    init_poses_high: NDArray[np.float64] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        # NOTE: the spec is frozen, so the derived fields must be set this way.
+        for name, pose in [
+            ("robot_init_pose_low", self.robot_init_pose_bounds[0]),
+            ("robot_init_pose_high", self.robot_init_pose_bounds[1]),
+            ("target_region_init_low", self.target_region_init_bounds[0]),
+            ("target_region_init_high", self.target_region_init_bounds[1]),
+        ]:
+            object.__setattr__(self, name, np.array([pose.x, pose.y, pose.theta]))
+        object.__setattr__(
+            self,
+            "init_poses_low",
+            np.concatenate([self.robot_init_pose_low, self.target_region_init_low]),
+        )
+        object.__setattr__(
+            self,
+            "init_poses_high",
+            np.concatenate([self.robot_init_pose_high, self.target_region_init_high]),
+        )
+
 
 class ObjectCentricMotion2DEnv(Geom2DRobotEnv):
     """Only 2D motion planning is needed to reach a goal region.
@@ -140,16 +192,31 @@ class ObjectCentricMotion2DEnv(Geom2DRobotEnv):
             "render_modes": ["rgb_array"],
             "render_fps": self._spec.render_fps,
         }
-
-    def _sample_initial_state(self) -> ObjectCentricState:
-        # Sample initial robot pose.
-        robot_pose = sample_se2_pose(self._spec.robot_init_pose_bounds, self.np_random)
-        # Sample initial target region pose.
-        target_region_pose = sample_se2_pose(
-            self._spec.target_region_init_bounds, self.np_random
+        # The target region is static, so its geometry is cached on reset. If
+        # it is axis-aligned, its bounds (min_x, min_y, max_x, max_y) are too.
+        self._target_region_geom: Rectangle | None = None
+        self._target_region_bounds: tuple[float, float, float, float] | None = None
+        # The walls only depend on the spec and action space.
+        assert isinstance(self.action_space, CRVRobotActionSpace)
+        min_dx, min_dy = self.action_space.low[:2]
+        max_dx, max_dy = self.action_space.high[:2]
+        wall_state_dict = create_walls_from_world_boundaries(
+            self._spec.world_min_x,
+            self._spec.world_max_x,
+            self._spec.world_min_y,
+            self._spec.world_max_y,
+            min_dx,
+            max_dx,
+            min_dy,
+            max_dy,
         )
-        # Sample obstacles to form vertical narrow passages.
-        obstacles: list[tuple[SE2Pose, tuple[float, float]]] = []
+        self._wall_state_data = {
+            o: create_feature_vector(o.type, d) for o, d in wall_state_dict.items()
+        }
+        # The objects that are created in every initial state only differ in
+        # their poses and shapes, so create their feature vectors once.
+        self._initial_state_templates = self._create_initial_state_templates()
+        # The x positions of the passages only depend on the number of passages.
         min_x = self._spec.obstacle_min_x
         max_x = self._spec.obstacle_max_x
         if self._num_passages > 1:
@@ -159,32 +226,125 @@ class ObjectCentricMotion2DEnv(Geom2DRobotEnv):
             assert x_dist_between_passages > 2 * self._spec.robot_base_radius
         else:
             x_dist_between_passages = 0.0  # not used
-        for i in range(self._num_passages):
-            # Sample the passage parameters.
-            passage_y = self.np_random.uniform(*self._spec.obstacle_passage_y_bounds)
-            passage_height = self.np_random.uniform(
-                *self._spec.obstacle_passage_height_bounds
+        self._obstacle_xs = min_x + np.arange(self._num_passages) * (
+            self._spec.obstacle_width + x_dist_between_passages
+        )
+        # The x positions and widths of the bottom and then top obstacles.
+        self._obstacle_collision_xs = np.concatenate(
+            [self._obstacle_xs, self._obstacle_xs]
+        )
+        self._obstacle_collision_widths = np.full(
+            2 * self._num_passages, self._spec.obstacle_width
+        )
+        # Radius of a circle that contains the robot with its arm retracted,
+        # used to check for collisions when sampling initial states.
+        self._robot_collision_radius = np.hypot(
+            self._spec.robot_base_radius + self._spec.robot_gripper_width,
+            self._spec.robot_gripper_height / 2,
+        )
+        # The objects in sampled initial states, following the naming below.
+        self._robot_object = Object("robot", CRVRobotType)
+        self._target_region_object = Object("target_region", TargetRegionType)
+        self._obstacle_objects = [
+            Object(f"obstacle{i}", RectangleType) for i in range(2 * num_passages)
+        ]
+        # The robot and target region objects do not change within an episode,
+        # so they are cached on reset.
+        self._robot: Object | None = None
+        self._target_region: Object | None = None
+
+    def reset(self, *args, **kwargs) -> tuple[ObjectCentricState, dict]:
+        obs, info = super().reset(*args, **kwargs)
+        assert self._current_state is not None
+        self._robot = self._current_state.get_objects(CRVRobotType)[0]
+        self._target_region = self._current_state.get_objects(TargetRegionType)[0]
+        geom = rectangle_object_to_geom(
+            self._current_state, self._target_region, self._static_object_body_cache
+        )
+        assert isinstance(geom, Rectangle)
+        self._target_region_geom = geom
+        if np.isclose(geom.theta, 0.0):
+            self._target_region_bounds = (
+                geom.x,
+                geom.y,
+                geom.x + geom.width,
+                geom.y + geom.height,
+            )
+        else:
+            self._target_region_bounds = None
+        return obs, info
+
+    def _sample_initial_state(self) -> ObjectCentricState:
+        xs = self._obstacle_xs
+        for _ in range(self._spec.max_init_sampling_attempts):
+            # Sample initial robot and target region poses.
+            init_poses = self.np_random.uniform(
+                self._spec.init_poses_low, self._spec.init_poses_high
+            )
+            robot_pose = SE2Pose(*init_poses[:3])
+            target_region_pose = SE2Pose(*init_poses[3:])
+            # Sample obstacles to form vertical narrow passages. Each row is
+            # (passage y, passage height) so that the random draws are in the
+            # same order as sampling them one passage at a time.
+            passage_params = self.np_random.uniform(
+                (
+                    self._spec.obstacle_passage_y_bounds[0],
+                    self._spec.obstacle_passage_height_bounds[0],
+                ),
+                (
+                    self._spec.obstacle_passage_y_bounds[1],
+                    self._spec.obstacle_passage_height_bounds[1],
+                ),
+                size=(self._num_passages, 2),
+            )
+            passage_ys, passage_heights = passage_params.T
+            # The bottom obstacles start at the bottom of the world and the top
+            # obstacles end at the top of the world.
+            bottom_ys = np.full(self._num_passages, self._spec.world_min_y)
+            bottom_heights = passage_ys - bottom_ys
+            top_ys = bottom_ys + bottom_heights + passage_heights
+            top_heights = self._spec.world_max_y - top_ys
+            # Check for collisions between the robot and the obstacles. The
+            # target region does not collide with anything.
+            if not circle_intersects_rectangles(
+                robot_pose.x,
+                robot_pose.y,
+                self._robot_collision_radius,
+                self._obstacle_collision_xs,
+                np.concatenate([bottom_ys, top_ys]),
+                self._obstacle_collision_widths,
+                np.concatenate([bottom_heights, top_heights]),
+            ):
+                break
+        else:
+            raise RuntimeError("Failed to sample initial state.")
+        # Create the obstacles.
+        obstacles: list[tuple[SE2Pose, tuple[float, float]]] = []
+        for x, bottom_y, bottom_height, top_y, top_height in zip(
+            xs.tolist(),
+            bottom_ys.tolist(),
+            bottom_heights.tolist(),
+            top_ys.tolist(),
+            top_heights.tolist(),
+            strict=True,
+        ):
+            obstacles.append(
+                (SE2Pose(x, bottom_y, 0.0), (self._spec.obstacle_width, bottom_height))
+            )
+            obstacles.append(
+                (SE2Pose(x, top_y, 0.0), (self._spec.obstacle_width, top_height))
             )
-            x = min_x + i * (self._spec.obstacle_width + x_dist_between_passages)
-            # Create the bottom obstacle.
-            y = self._spec.world_min_y
-            height = passage_y - y
-            pose = SE2Pose(x, y, 0.0)
-            shape = (self._spec.obstacle_width, height)
-            obstacles.append((pose, shape))
-            # Create the top obstacle.
-            y = y + height + passage_height
-            pose = SE2Pose(x, y, 0.0)
-            height = self._spec.world_max_y - y
-            shape = (self._spec.obstacle_width, height)
-            obstacles.append((pose, shape))
 
         state = self._create_initial_state(robot_pose, target_region_pose, obstacles)
 
-        # Sanity check.
-        robot = state.get_objects(CRVRobotType)[0]
-        target_region = state.get_objects(TargetRegionType)[0]
-        assert not state_has_collision(state, {robot, target_region}, set(state), {})
+        # Sanity check, since the collision check above is approximate.
+        if self._spec.validate_initial_state and __debug__:
+            assert not state_has_collision(
+                state,
+                {self._robot_object, self._target_region_object},
+                set(state),
+                {},
+            )
 
         return state
 
@@ -194,86 +354,82 @@ class ObjectCentricMotion2DEnv(Geom2DRobotEnv):
         target_region_pose: SE2Pose | None = None,
         obstacles: list[tuple[SE2Pose, tuple[float, float]]] | None = None,
     ) -> ObjectCentricState:
-
-        init_state_dict: dict[Object, dict[str, float]] = {}
-
-        # Create room walls.
-        assert isinstance(self.action_space, CRVRobotActionSpace)
-        min_dx, min_dy = self.action_space.low[:2]
-        max_dx, max_dy = self.action_space.high[:2]
-        wall_state_dict = create_walls_from_world_boundaries(
-            self._spec.world_min_x,
-            self._spec.world_max_x,
-            self._spec.world_min_y,
-            self._spec.world_max_y,
-            min_dx,
-            max_dx,
-            min_dy,
-            max_dy,
-        )
-        init_state_dict.update(wall_state_dict)
+        # Add the room walls, which are created once in __init__().
+        init_state_data: dict[Object, NDArray[Any]] = {
+            o: v.copy() for o, v in self._wall_state_data.items()
+        }
+        templates = self._initial_state_templates
 
         # Create the robot.
-        robot = Object("robot", CRVRobotType)
-        init_state_dict[robot] = {
-            "x": robot_pose.x,
-            "y": robot_pose.y,
-            "theta": robot_pose.theta,
-            "base_radius": self._spec.robot_base_radius,
-            "arm_joint": self._spec.robot_base_radius,  # arm is fully retracted
-            "arm_length": self._spec.robot_arm_length,
-            "vacuum": 0.0,  # vacuum is off
-            "gripper_height": self._spec.robot_gripper_height,
-            "gripper_width": self._spec.robot_gripper_width,
-        }
+        robot_vec = templates["robot"].copy()
+        robot_vec[CRV_ROBOT_POSE_FEATURE_IDXS] = (
+            robot_pose.x,
+            robot_pose.y,
+            robot_pose.theta,
+        )
+        init_state_data[self._robot_object] = robot_vec
 
         # Create the target region.
         if target_region_pose is not None:
-            target_region = Object("target_region", TargetRegionType)
-            init_state_dict[target_region] = {
-                "x": target_region_pose.x,
-                "y": target_region_pose.y,
-                "theta": target_region_pose.theta,
-                "width": self._spec.target_region_shape[0],
-                "height": self._spec.target_region_shape[1],
-                "static": True,  # NOTE
-                "color_r": self._spec.target_region_rgb[0],
-                "color_g": self._spec.target_region_rgb[1],
-                "color_b": self._spec.target_region_rgb[2],
-                "z_order": ZOrder.NONE.value,
-            }
+            target_region_vec = templates["target_region"].copy()
+            target_region_vec[RECTANGLE_GEOMETRY_FEATURE_IDXS] = (
+                target_region_pose.x,
+                target_region_pose.y,
+                self._spec.target_region_shape[0],
+                self._spec.target_region_shape[1],
+                target_region_pose.theta,
+            )
+            init_state_data[self._target_region_object] = target_region_vec
 
         # Create the obstacles.
         if obstacles:
-            for i, (obstacle_pose, obstacle_shape) in enumerate(obstacles):
-                obstacle = Object(f"obstacle{i}", RectangleType)
-                init_state_dict[obstacle] = {
-                    "x": obstacle_pose.x,
-                    "y": obstacle_pose.y,
-                    "theta": obstacle_pose.theta,
-                    "width": obstacle_shape[0],
-                    "height": obstacle_shape[1],
-                    "static": True,  # NOTE
-                    "color_r": self._spec.obstacle_rgb[0],
-                    "color_g": self._spec.obstacle_rgb[1],
-                    "color_b": self._spec.obstacle_rgb[2],
-                    "z_order": ZOrder.ALL.value,
-                }
+            assert len(obstacles) <= len(self._obstacle_objects)
+            obstacle_vecs = np.tile(templates["obstacle"], (len(obstacles), 1))
+            obstacle_vecs[:, RECTANGLE_GEOMETRY_FEATURE_IDXS] = [
+                (pose.x, pose.y, shape[0], shape[1], pose.theta)
+                for pose, shape in obstacles
+            ]
+            init_state_data.update(zip(self._obstacle_objects, obstacle_vecs))
 
         # Finalize state.
-        return create_state_from_dict(init_state_dict, Geom2DRobotEnvTypeFeatures)
+        return ObjectCentricState(init_state_data, Geom2DRobotEnvTypeFeatures)
+
+    def _create_initial_state_templates(self) -> dict[str, NDArray[np.float64]]:
+        """Create feature vectors for the objects that are created in every
+        initial state, leaving the poses and shapes that vary between initial
+        states as zeros."""
+        return {
+            "robot": create_crv_robot_template(
+                self._spec.robot_base_radius,
+                self._spec.robot_arm_length,
+                self._spec.robot_gripper_height,
+                self._spec.robot_gripper_width,
+            ),
+            "target_region": create_rectangle_template(
+                TargetRegionType,
+                self._spec.target_region_rgb,
+                ZOrder.NONE,
+                static=True,
+            ),
+            "obstacle": create_rectangle_template(
+                RectangleType, self._spec.obstacle_rgb, ZOrder.ALL, static=True
+            ),
+        }
 
     def _get_reward_and_done(self) -> tuple[float, bool]:
         # Terminate when the robot position is in the target region.
         assert self._current_state is not None
-        robot = self._current_state.get_objects(CRVRobotType)[0]
-        x = self._current_state.get(robot, "x")
-        y = self._current_state.get(robot, "y")
-        target_region = self._current_state.get_objects(TargetRegionType)[0]
-        target_region_geom = rectangle_object_to_geom(
-            self._current_state, target_region, self._static_object_body_cache
-        )
-        terminated = target_region_geom.contains_point(x, y)
+        assert self._robot is not None, "Need to call reset()"
+        robot_data = self._current_state[self._robot]
+        x_idx, y_idx, _ = CRV_ROBOT_POSE_FEATURE_IDXS
+        x = robot_data[x_idx]
+        y = robot_data[y_idx]
+        if self._target_region_bounds is not None:
+            min_x, min_y, max_x, max_y = self._target_region_bounds
+            terminated = min_x <= x <= max_x and min_y <= y <= max_y
+        else:
+            assert self._target_region_geom is not None, "Need to call reset()"
+            terminated = self._target_region_geom.contains_point(x, y)
         return -1.0, terminated
 
 
@@ -284,6 +440,7 @@ class Motion2DEnv(gymnasium.Env[NDArray[np.float32], NDArray[np.float32]]):
         self,
         num_passages: int = 2,
         spec: Motion2DEnvSpec = Motion2DEnvSpec(),
+        share_obs_buffer: bool = False,
         **kwargs,
     ) -> None:
         super().__init__()
@@ -298,45 +455,66 @@ class Motion2DEnv(gymnasium.Env[NDArray[np.float32], NDArray[np.float32]]):
         assert isinstance(self._geom2d_env.observation_space, ObjectCentricStateSpace)
         # Make observation vectors start with the robot, then target region,
         # then obstacle blocks. Don't include the walls because those are
-        # universally constant.
-        exemplar_object_centric_state, _ = self._geom2d_env.reset()
-        obj_name_to_obj = {o.name: o for o in exemplar_object_centric_state}
+        # universally constant. The objects are named as in the initial states
+        # of ObjectCentricMotion2DEnv, so no state is sampled here.
+        # NOTE: obstacle names are sorted as strings, e.g., obstacle10 before
+        # obstacle2.
         self._constant_objects = [
-            obj_name_to_obj["robot"],
-            obj_name_to_obj["target_region"],
+            Object("robot", CRVRobotType),
+            Object("target_region", TargetRegionType),
         ]
-        obstacle_names = {o for o in obj_name_to_obj if o.startswith("obstacle")}
-        assert len(obstacle_names) == 2 * num_passages
-        for obstacle_name in sorted(obstacle_names):
-            self._constant_objects.append(obj_name_to_obj[obstacle_name])
+        obstacle_names = sorted(f"obstacle{i}" for i in range(2 * num_passages))
+        for obstacle_name in obstacle_names:
+            self._constant_objects.append(Object(obstacle_name, RectangleType))
         self.observation_space = self._geom2d_env.observation_space.to_box(
             self._constant_objects, Geom2DRobotEnvTypeFeatures
         )
         self.action_space = self._geom2d_env.action_space
         assert isinstance(self.observation_space, ObjectCentricBoxSpace)
         assert isinstance(self.action_space, CRVRobotActionSpace)
-        # Add descriptions to metadata for doc generation.
-        env_md = create_env_description(num_passages)
+        self._vectorizer = BoxObservationVectorizer(self.observation_space)
+        # If the buffer is shared, observations are a read-only view of it that
+        # is overwritten by the next reset() or step(). Callers that keep
+        # observations around (e.g., demo collection) need to copy them, but
+        # vector env wrappers that stack observations already copy.
+        self._share_obs_buffer = share_obs_buffer
+        self._obs_view = self._vectorizer.buffer.view()
+        self._obs_view.flags.writeable = False
+        # The target region and obstacles are static, so only the robot part
+        # of the observation vector changes within an episode.
+        self._dynamic_objects = self._constant_objects[:1]
+        # Add descriptions to metadata for doc generation. They are only built
+        # on first access, so that env creation does not pay for them.
+        self._num_passages = num_passages
+        self.metadata = LazyMetadata(
+            {
+                "render_modes": self._geom2d_env.metadata["render_modes"],
+                "render_fps": self._geom2d_env.metadata["render_fps"],
+            },
+            self._create_metadata_descriptions,
+        )
+
+    def _create_metadata_descriptions(self) -> dict[str, Any]:
+        env_md = create_env_description(self._num_passages)
+        assert isinstance(self.observation_space, ObjectCentricBoxSpace)
+        assert isinstance(self.action_space, CRVRobotActionSpace)
         obs_md = self.observation_space.create_markdown_description()
         act_md = self.action_space.create_markdown_description()
         reward_md = "A penalty of -1.0 is given at every time step until termination, which occurs when the robot's position is within the target region.\n"  # pylint: disable=line-too-long
         references_md = "Narrow passages are a classic challenge in motion planning.\n"  # pylint: disable=line-too-long
-        self.metadata = {
+        return {
             "description": env_md,
             "observation_space_description": obs_md,
             "action_space_description": act_md,
             "reward_description": reward_md,
             "references": references_md,
-            "render_modes": self._geom2d_env.metadata["render_modes"],
-            "render_fps": self._geom2d_env.metadata["render_fps"],
         }
 
     def reset(self, *args, **kwargs) -> tuple[NDArray[np.float32], dict]:
         super().reset(*args, **kwargs)  # necessary to reset RNG if seed is given
         obs, info = self._geom2d_env.reset(*args, **kwargs)
-        assert isinstance(self.observation_space, ObjectCentricBoxSpace)
-        vec_obs = self.observation_space.vectorize(obs)
-        return vec_obs, info
+        self._vectorizer.vectorize(obs)
+        return self._get_vec_obs(), info
 
     def step(
         self, *args, **kwargs
@@ -344,9 +522,13 @@ class Motion2DEnv(gymnasium.Env[NDArray[np.float32], NDArray[np.float32]]):
         obs, reward, terminated, truncated, done = self._geom2d_env.step(
             *args, **kwargs
         )
-        assert isinstance(self.observation_space, ObjectCentricBoxSpace)
-        vec_obs = self.observation_space.vectorize(obs)
-        return vec_obs, reward, terminated, truncated, done
+        self._vectorizer.vectorize(obs, self._dynamic_objects)
+        return self._get_vec_obs(), reward, terminated, truncated, done
+
+    def _get_vec_obs(self) -> NDArray[np.float32]:
+        if self._share_obs_buffer:
+            return self._obs_view
+        return self._vectorizer.buffer.copy()
 
     def render(self):
         return self._geom2d_env.render()
@@ -359,6 +541,23 @@ class Motion2DEnv(gymnasium.Env[NDArray[np.float32], NDArray[np.float32]]):
         return get_geom2d_crv_robot_action_from_gui_input(self.action_space, gui_input)
 
 
+def circle_intersects_rectangles(
+    center_x: float,
+    center_y: float,
+    radius: float,
+    xs: NDArray[np.float64],
+    ys: NDArray[np.float64],
+    widths: NDArray[np.float64],
+    heights: NDArray[np.float64],
+) -> bool:
+    """Check whether a circle intersects (or touches) any of the axis-aligned
+    rectangles with the given bottom-left corners and shapes."""
+    # Find the distance from the center to the closest point on each rectangle.
+    dxs = np.maximum(np.maximum(xs - center_x, 0.0), center_x - (xs + widths))
+    dys = np.maximum(np.maximum(ys - center_y, 0.0), center_y - (ys + heights))
+    return bool(np.any(dxs**2 + dys**2 <= radius**2))
+
+
 def create_env_description(num_passages: int = 2) -> str:
     """Create a human-readable environment description."""
     # pylint: disable=line-too-long
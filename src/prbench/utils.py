@@ -1,10 +1,29 @@
 """Utility functions."""
 
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator
 
 import numpy as np
+from geom2drobotenvs.object_types import (
+    CRVRobotType,
+    Geom2DRobotEnvTypeFeatures,
+    RectangleType,
+)
+from geom2drobotenvs.structs import ZOrder
 from geom2drobotenvs.utils import CRVRobotActionSpace
 from numpy.typing import NDArray
+from relational_structs import Object, ObjectCentricState, Type
+from relational_structs.spaces import ObjectCentricBoxSpace
+
+# Indices of the robot pose features (x, y, theta).
+CRV_ROBOT_POSE_FEATURE_IDXS = [
+    Geom2DRobotEnvTypeFeatures[CRVRobotType].index(f) for f in ("x", "y", "theta")
+]
+# Indices of the rectangle features (x, y, width, height, theta), which is the
+# argument order of the vectorized rectangle geometry functions.
+RECTANGLE_GEOMETRY_FEATURE_IDXS = [
+    Geom2DRobotEnvTypeFeatures[RectangleType].index(f)
+    for f in ("x", "y", "width", "height", "theta")
+]
 
 
 def get_geom2d_crv_robot_action_from_gui_input(
@@ -45,3 +64,176 @@ def get_geom2d_crv_robot_action_from_gui_input(
         action[4] = 1.0
 
     return action
+
+
+def create_feature_vector(
+    object_type: Type, features: dict[str, float]
+) -> NDArray[np.float64]:
+    """Create the feature vector of an object from its named features."""
+    return np.array(
+        [features[f] for f in Geom2DRobotEnvTypeFeatures[object_type]],
+        dtype=np.float64,
+    )
+
+
+def create_crv_robot_template(
+    base_radius: float,
+    arm_length: float,
+    gripper_height: float,
+    gripper_width: float,
+) -> NDArray[np.float64]:
+    """Create the feature vector of a CRV robot with its arm retracted and its
+    vacuum off, leaving the pose as zeros."""
+    return create_feature_vector(
+        CRVRobotType,
+        {
+            "x": 0.0,
+            "y": 0.0,
+            "theta": 0.0,
+            "base_radius": base_radius,
+            "arm_joint": base_radius,  # fully retracted
+            "arm_length": arm_length,
+            "vacuum": 0.0,  # vacuum is off
+            "gripper_height": gripper_height,
+            "gripper_width": gripper_width,
+        },
+    )
+
+
+def create_rectangle_template(
+    object_type: Type,
+    rgb: tuple[float, float, float],
+    z_order: ZOrder,
+    static: bool,
+) -> NDArray[np.float64]:
+    """Create the feature vector of a rectangle, leaving the pose and shape as
+    zeros."""
+    return create_feature_vector(
+        object_type,
+        {
+            "x": 0.0,
+            "y": 0.0,
+            "theta": 0.0,
+            "width": 0.0,
+            "height": 0.0,
+            "static": static,
+            "color_r": rgb[0],
+            "color_g": rgb[1],
+            "color_b": rgb[2],
+            "z_order": z_order.value,
+        },
+    )
+
+
+class BoxObservationVectorizer:
+    """Vectorizes object-centric states like ObjectCentricBoxSpace.vectorize(),
+    but writes into a preallocated buffer.
+
+    The layout of the vectors is constant, so where the features of each
+    object go is computed once.
+    """
+
+    def __init__(self, observation_space: ObjectCentricBoxSpace) -> None:
+        self._object_slices: dict[Object, slice] = {}
+        start = 0
+        for obj in observation_space.constant_objects:
+            end = start + len(observation_space.type_features[obj.type])
+            self._object_slices[obj] = slice(start, end)
+            start = end
+        assert start == observation_space.shape[0]
+        self.buffer = np.empty(observation_space.shape, dtype=np.float32)
+
+    def vectorize(
+        self, state: ObjectCentricState, objects: Iterable[Object] | None = None
+    ) -> NDArray[np.float32]:
+        """Write the features of the given objects (by default, all objects)
+        into the buffer and return it.
+
+        The buffer is overwritten by later calls, so callers that hold
+        onto the returned vector need to copy it.
+        """
+        if objects is None:
+            objects = self._object_slices
+        for obj in objects:
+            self.buffer[self._object_slices[obj]] = state[obj]
+        return self.buffer
+
+
+class LazyMetadata(dict):
+    """Env metadata where some entries are built on first access.
+
+    The given metadata (e.g., render_modes and render_fps, which
+    rendering wrappers read) is available immediately. The entries
+    returned by build_lazy_metadata (e.g., markdown descriptions that
+    are only needed for doc generation) are added the first time they,
+    or the full contents, are accessed.
+    """
+
+    def __init__(
+        self,
+        metadata: dict[str, Any],
+        build_lazy_metadata: Callable[[], dict[str, Any]],
+    ) -> None:
+        super().__init__(metadata)
+        self._build_lazy_metadata: Callable[[], dict[str, Any]] | None = (
+            build_lazy_metadata
+        )
+
+    def _build(self) -> None:
+        build_lazy_metadata = self._build_lazy_metadata
+        if build_lazy_metadata is not None:
+            self._build_lazy_metadata = None
+            self.update(build_lazy_metadata())
+
+    def __missing__(self, key: str) -> Any:
+        if self._build_lazy_metadata is None:
+            raise KeyError(key)
+        self._build()
+        return self[key]
+
+    def __contains__(self, key: object) -> bool:
+        if not super().__contains__(key):
+            self._build()
+        return super().__contains__(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def __iter__(self) -> Iterator[str]:
+        self._build()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        self._build()
+        return super().__len__()
+
+    def keys(self):
+        self._build()
+        return super().keys()
+
+    def values(self):
+        self._build()
+        return super().values()
+
+    def items(self):
+        self._build()
+        return super().items()
+
+    def copy(self) -> dict[str, Any]:
+        self._build()
+        return dict(super().items())
+
+    def __eq__(self, other: object) -> bool:
+        self._build()
+        return super().__eq__(other)
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
+
+    def __repr__(self) -> str:
+        self._build()
+        return super().__repr__()
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Copies and pickles are plain dicts with all entries built.
+        return (dict, (self.copy(),))
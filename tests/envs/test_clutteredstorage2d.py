@@ -1,14 +1,25 @@
 """Tests for clutteredstoragel2d.py."""
 
+import numpy as np
 from conftest import MAKE_VIDEOS
+from geom2drobotenvs.utils import SE2Pose, state_has_collision
 from gymnasium.spaces import Box
 from gymnasium.wrappers import RecordVideo
+from relational_structs.spaces import ObjectCentricBoxSpace
 
 import prbench
+from prbench.envs import clutteredstorage2d
 from prbench.envs.clutteredstorage2d import (
+    ClutteredStorage2DEnv,
+    ClutteredStorage2DEnvSpec,
     ObjectCentricClutteredStorage2DEnv,
     ShelfType,
     TargetBlockType,
+    all_rects_inside_aabb,
+    get_rectangle_aabbs,
+    get_rectangles_from_centers,
+    poisson_disk_2d,
+    rectangles_overlap,
 )
 
 
@@ -59,3 +70,183 @@ def test_clutteredstorage2d_termination():
     state, reward, terminated, _, _ = env.step(action)
     assert reward == -1.0
     assert terminated
+
+
+def test_clutteredstorage2d_termination_rotated_shelf():
+    """Tests termination when the shelf is not axis-aligned."""
+    env = ObjectCentricClutteredStorage2DEnv(num_blocks=1)
+    state, _ = env.reset(seed=0)
+    shelf = state.get_objects(ShelfType)[0]
+    block = state.get_objects(TargetBlockType)[0]
+    theta = np.pi / 16
+    state.set(shelf, "theta", theta)
+    noop = np.zeros(env.action_space.shape, dtype=np.float32)
+    env.reset(options={"init_state": state})
+    _, _, terminated, _, _ = env.step(noop)
+    assert not terminated
+    # Move the block to the center of the shelf, rotated like the shelf.
+    shelf_x, shelf_y = state.get(shelf, "x"), state.get(shelf, "y")
+    shelf_width, shelf_height = state.get(shelf, "width"), state.get(shelf, "height")
+    center_x = (
+        shelf_x + shelf_width / 2 * np.cos(theta) - shelf_height / 2 * np.sin(theta)
+    )
+    center_y = (
+        shelf_y + shelf_width / 2 * np.sin(theta) + shelf_height / 2 * np.cos(theta)
+    )
+    x, y, _, _, _ = get_rectangles_from_centers(
+        np.array([center_x]),
+        np.array([center_y]),
+        state.get(block, "width"),
+        state.get(block, "height"),
+        np.array([theta]),
+    )[0]
+    state.set(block, "x", x)
+    state.set(block, "y", y)
+    state.set(block, "theta", theta)
+    env.reset(options={"init_state": state})
+    _, _, terminated, _, _ = env.step(noop)
+    assert terminated
+
+
+def test_all_rects_inside_aabb():
+    """Tests for all_rects_inside_aabb()."""
+    aabb = np.array([0.0, 0.0, 2.0, 1.0])
+    inside = [0.5, 0.25, 1.0, 0.5, 0.0]
+    touching = [0.0, 0.0, 2.0, 1.0, 0.0]
+    outside = [1.5, 0.25, 1.0, 0.5, 0.0]
+    # Inside when axis-aligned, but a corner sticks out when rotated.
+    rotated = [1.0, 0.25, 1.0, 0.5, np.pi / 4]
+    assert all_rects_inside_aabb(np.array([inside]), aabb)
+    assert all_rects_inside_aabb(np.array([inside, touching]), aabb)
+    assert not all_rects_inside_aabb(np.array([inside, outside]), aabb)
+    assert not all_rects_inside_aabb(np.array([rotated]), aabb)
+
+
+def test_get_rectangle_aabbs():
+    """Tests for get_rectangle_aabbs()."""
+    aabbs = get_rectangle_aabbs(
+        np.array([0.0, 1.0]),
+        np.array([0.0, 1.0]),
+        2.0,
+        1.0,
+        np.array([0.0, np.pi / 2]),
+    )
+    assert np.allclose(aabbs, [[0.0, 0.0, 2.0, 1.0], [0.0, 1.0, 1.0, 3.0]])
+
+
+def test_rectangles_overlap():
+    """Tests for rectangles_overlap()."""
+    rect = np.array([0.0, 0.0, 1.0, 1.0, 0.0])
+    others = np.array(
+        [
+            [0.5, 0.5, 1.0, 1.0, 0.0],  # overlapping
+            [2.0, 0.0, 1.0, 1.0, 0.0],  # separated
+            [1.0, 0.0, 1.0, 1.0, 0.0],  # touching
+            # Diamonds near the top right corner.
+            [1.6, 1.6 - np.sqrt(0.5), 1.0, 1.0, np.pi / 4],  # separated
+            [1.3, 1.3 - np.sqrt(0.5), 1.0, 1.0, np.pi / 4],  # overlapping
+        ]
+    )
+    assert rectangles_overlap(rect, others).tolist() == [
+        True,
+        False,
+        True,
+        False,
+        True,
+    ]
+
+
+def test_get_target_block_in_shelf_center_positions():
+    """Tests for get_target_block_in_shelf_center_positions()."""
+    spec = ClutteredStorage2DEnvSpec()
+    shelf_pose = SE2Pose(1.0, 2.0, 0.0)
+    positions = spec.get_target_block_in_shelf_center_positions(3, shelf_pose)
+    assert positions.shape == (3, 2)
+    assert np.all(np.diff(positions[:, 0]) > 0)
+    assert np.allclose(positions[:, 1], 2.0 + 2 * spec.target_block_shape[1])
+    shelf_width = spec.get_shelf_width(3)
+    assert np.all(positions[:, 0] > shelf_pose.x)
+    assert np.all(positions[:, 0] < shelf_pose.x + shelf_width)
+
+
+def test_clutteredstorage2d_feature_major_obs():
+    """Tests that feature-major observations permute the default layout."""
+    env = ClutteredStorage2DEnv(num_blocks=3)
+    fm_env = ClutteredStorage2DEnv(num_blocks=3, feature_major_obs=True)
+    assert fm_env.observation_space.shape == env.observation_space.shape
+    # The per-object Box space methods do not apply to feature-major observations.
+    assert not isinstance(fm_env.observation_space, ObjectCentricBoxSpace)
+    obs, _ = env.reset(seed=123)
+    fm_obs, _ = fm_env.reset(seed=123)
+    assert fm_env.observation_space.contains(fm_obs)
+    assert np.allclose(np.sort(obs), np.sort(fm_obs))
+    # The x features of all objects come first, in the default object order.
+    xs = [
+        env.observation_space.get_object_subvector(obs, obj.name)[0]
+        for obj in env.observation_space.constant_objects
+    ]
+    assert np.allclose(fm_obs[: len(xs)], xs)
+
+
+def test_poisson_disk_2d():
+    """Tests for poisson_disk_2d()."""
+    rng = np.random.default_rng(123)
+    forbidden_aabbs = np.array([[1.0, 1.0, 2.0, 2.0]])
+    points = poisson_disk_2d(rng, (0.0, 0.0, 3.0, 3.0), 0.5, forbidden_aabbs, 10)
+    assert points.shape == (10, 2)
+    assert np.all((points >= 0.0) & (points <= 3.0))
+    in_forbidden = np.all((points >= 1.0) & (points <= 2.0), axis=1)
+    assert not np.any(in_forbidden)
+    dists = np.linalg.norm(points[:, None] - points[None], axis=2)
+    assert np.all(dists[np.triu_indices(len(points), k=1)] >= 0.5)
+    # Fewer points are returned if they do not fit.
+    points = poisson_disk_2d(rng, (0.0, 0.0, 1.0, 1.0), 2.0, forbidden_aabbs, 10)
+    assert len(points) == 1
+
+
+def test_clutteredstorage2d_init_sampling_batch_size():
+    """Tests that initial states do not depend on the sampling batch size."""
+    env = ObjectCentricClutteredStorage2DEnv(num_blocks=7)
+    unbatched_env = ObjectCentricClutteredStorage2DEnv(
+        num_blocks=7, spec=ClutteredStorage2DEnvSpec(init_sampling_batch_size=1)
+    )
+    for seed in range(3):
+        state, _ = env.reset(seed=seed)
+        unbatched_state, _ = unbatched_env.reset(seed=seed)
+        objects = sorted(state)
+        assert sorted(unbatched_state) == objects
+        assert np.array_equal(state.vec(objects), unbatched_state.vec(objects))
+        # The RNG should also be left in the same position.
+        assert env.np_random.random() == unbatched_env.np_random.random()
+
+
+def test_clutteredstorage2d_poisson_disk_init_sampling():
+    """Tests initial state sampling with Poisson-disk sampling enabled."""
+    spec = ClutteredStorage2DEnvSpec(use_poisson_disk_init_sampling=True)
+    env = ObjectCentricClutteredStorage2DEnv(num_blocks=7, spec=spec)
+    other_env = ObjectCentricClutteredStorage2DEnv(num_blocks=7, spec=spec)
+    for seed in range(5):
+        state, _ = env.reset(seed=seed)
+        other_state, _ = other_env.reset(seed=seed)
+        objects = sorted(state)
+        assert np.array_equal(state.vec(objects), other_state.vec(objects))
+        blocks = set(state.get_objects(TargetBlockType))
+        assert not state_has_collision(state, blocks, set(state), {})
+
+
+def test_clutteredstorage2d_poisson_disk_init_sampling_fallback(monkeypatch):
+    """Tests that initial state sampling falls back to rejection sampling
+    when Poisson-disk sampling fails."""
+    monkeypatch.setattr(
+        clutteredstorage2d, "poisson_disk_2d", lambda *_: np.zeros((0, 2))
+    )
+    env = ObjectCentricClutteredStorage2DEnv(
+        num_blocks=7,
+        spec=ClutteredStorage2DEnvSpec(use_poisson_disk_init_sampling=True),
+    )
+    default_env = ObjectCentricClutteredStorage2DEnv(num_blocks=7)
+    for seed in range(3):
+        state, _ = env.reset(seed=seed)
+        default_state, _ = default_env.reset(seed=seed)
+        objects = sorted(state)
+        assert np.array_equal(state.vec(objects), default_state.vec(objects))
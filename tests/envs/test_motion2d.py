@@ -1,12 +1,23 @@
 """Tests for motion2d.py."""
 
+import copy
+import json
+
 import numpy as np
 from conftest import MAKE_VIDEOS
+from geom2drobotenvs.object_types import CRVRobotType
+from geom2drobotenvs.utils import state_has_collision
 from gymnasium.spaces import Box
 from gymnasium.wrappers import RecordVideo
 
 import prbench
-from prbench.envs.motion2d import Motion2DEnvSpec, ObjectCentricMotion2DEnv
+from prbench.envs.motion2d import (
+    Motion2DEnv,
+    Motion2DEnvSpec,
+    ObjectCentricMotion2DEnv,
+    TargetRegionType,
+    circle_intersects_rectangles,
+)
 
 prbench.register_all_environments()
 
@@ -66,3 +77,105 @@ def test_motion2d_observation_space():
     for _ in range(5):
         obs, _ = env.reset()
         assert env.observation_space.contains(obs)
+
+
+def test_motion2d_metadata():
+    """Tests that the metadata descriptions are built on first access."""
+    env = prbench.make("prbench/Motion2D-p2-v0")
+    metadata = env.unwrapped.metadata
+    assert metadata["render_fps"] > 0
+    # Reading the render entries does not build the descriptions.
+    assert not dict.__contains__(metadata, "description")
+    assert "2 narrow passages" in metadata["description"]
+    for key in ["observation_space_description", "action_space_description"]:
+        assert metadata[key]
+    # The descriptions are included when the metadata is serialized.
+    assert json.loads(json.dumps(metadata))["references"] == metadata["references"]
+    assert copy.deepcopy(metadata) == metadata
+    env.close()
+
+
+def test_motion2d_termination():
+    """Tests that the episode terminates when the robot reaches the target."""
+    env = ObjectCentricMotion2DEnv(num_passages=1)
+    state, _ = env.reset(seed=123)
+    robot = state.get_objects(CRVRobotType)[0]
+    target_region = state.get_objects(TargetRegionType)[0]
+    noop = np.zeros(env.action_space.shape, dtype=np.float32)
+    _, _, terminated, _, _ = env.step(noop)
+    assert not terminated
+    # Move the robot to the center of the target region.
+    state.set(
+        robot,
+        "x",
+        state.get(target_region, "x") + state.get(target_region, "width") / 2,
+    )
+    state.set(
+        robot,
+        "y",
+        state.get(target_region, "y") + state.get(target_region, "height") / 2,
+    )
+    env.reset(seed=123, options={"init_state": state})
+    _, reward, terminated, _, _ = env.step(noop)
+    assert reward == -1.0
+    assert terminated
+    env.close()
+
+
+def test_motion2d_no_initial_state_validation():
+    """Tests that initial states are collision-free without validation."""
+    env = ObjectCentricMotion2DEnv(
+        num_passages=5, spec=Motion2DEnvSpec(validate_initial_state=False)
+    )
+    for seed in range(5):
+        state, _ = env.reset(seed=seed)
+        robot = state.get_objects(CRVRobotType)[0]
+        target_region = state.get_objects(TargetRegionType)[0]
+        assert not state_has_collision(state, {robot, target_region}, set(state), {})
+    env.close()
+
+
+def test_circle_intersects_rectangles():
+    """Tests for circle_intersects_rectangles()."""
+    xs = np.array([0.0, 2.0])
+    ys = np.array([0.0, 0.0])
+    widths = np.array([1.0, 1.0])
+    heights = np.array([1.0, 1.0])
+    # Inside a rectangle.
+    assert circle_intersects_rectangles(0.5, 0.5, 0.1, xs, ys, widths, heights)
+    # Between the rectangles.
+    assert not circle_intersects_rectangles(1.5, 0.5, 0.4, xs, ys, widths, heights)
+    assert circle_intersects_rectangles(1.5, 0.5, 0.6, xs, ys, widths, heights)
+    # Near a corner, where the closest point is the corner itself.
+    assert not circle_intersects_rectangles(1.3, 1.3, 0.4, xs, ys, widths, heights)
+    assert circle_intersects_rectangles(1.3, 1.3, 0.5, xs, ys, widths, heights)
+    # No rectangles.
+    empty = np.array([])
+    assert not circle_intersects_rectangles(0.0, 0.0, 1.0, *[empty] * 4)
+
+
+def test_motion2d_observations_match_vectorize():
+    """Tests that observations match the generic vectorization."""
+    env = Motion2DEnv(num_passages=6)
+    object_centric_env = ObjectCentricMotion2DEnv(num_passages=6)
+    obs, _ = env.reset(seed=123)
+    state, _ = object_centric_env.reset(seed=123)
+    env.action_space.seed(123)
+    for _ in range(5):
+        assert np.array_equal(obs, env.observation_space.vectorize(state))
+        action = env.action_space.sample()
+        obs, _, _, _, _ = env.step(action)
+        state, _, _, _, _ = object_centric_env.step(action)
+
+
+def test_motion2d_share_obs_buffer():
+    """Tests that observations can share a read-only buffer."""
+    env = Motion2DEnv(num_passages=1, share_obs_buffer=True)
+    obs, _ = env.reset(seed=123)
+    assert not obs.flags.writeable
+    first_x = obs[0]
+    right = np.array([env.action_space.high[0], 0.0, 0.0, 0.0, 0.0], np.float32)
+    next_obs, _, _, _, _ = env.step(right)
+    assert next_obs is obs
+    assert obs[0] > first_x
+    env.close()